@@ -5,9 +5,8 @@ import streamlit as st
 import folium
 from streamlit_folium import st_folium
 from pathlib import Path
-import json
 
-from core.zones_map import load_zones, zone_from_latlon
+from core.zones_map import load_zones, read_geojson, zone_from_latlon
 from core.streets import find_street
 from core.zone_rules_repository import get_zone_rule
 
@@ -17,22 +16,53 @@ BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 ZONE_FILE = DATA_DIR / "zoneamento_light.json"
 
+MAP_KEY = "zones_map"
+
+# casas decimais das coordenadas enviadas ao navegador (5 ≈ 1 m, suficiente p/ desenhar)
+MAP_COORD_DECIMALS = 5
+
 
 # =============================
 # Helpers
 # =============================
 
+def _round_coords(coords, ndigits):
+    if coords and isinstance(coords[0], (int, float)):
+        return [round(c, ndigits) for c in coords]
+    return [_round_coords(c, ndigits) for c in coords]
+
+
+def _map_geojson(gj):
+    """Cópia do GeoJSON só para o mapa (payload menor).
+
+    - coordenadas arredondadas
+    - properties reduzidas a `sigla` (único campo usado no tooltip)
+    """
+    feats = []
+    for f in gj.get("features") or []:
+        geom = f.get("geometry")
+        if geom and geom.get("coordinates"):
+            geom = {**geom, "coordinates": _round_coords(geom["coordinates"], MAP_COORD_DECIMALS)}
+        props = f.get("properties") or {}
+        feats.append({"type": "Feature", "geometry": geom, "properties": {"sigla": props.get("sigla")}})
+    return {"type": "FeatureCollection", "features": feats}
+
+
 @st.cache_resource(show_spinner=False)
 def _zones():
-    with ZONE_FILE.open("r", encoding="utf-8") as f:
-        gj = json.load(f)
+    gj = read_geojson(ZONE_FILE)
+    # um único parse do arquivo serve ao mapa e ao point-in-polygon (este vem
+    # do cache WKB em disco quando existe); o point-in-polygon usa a precisão
+    # original, o mapa a versão arredondada
     return {
-        "prepared": load_zones(ZONE_FILE),
-        "geojson": gj,
+        "prepared": load_zones(ZONE_FILE, gj),
+        "geojson": _map_geojson(gj),
     }
 
 
-def _render_map(zones_gj, lat0=-3.689, lon0=-40.349, click_lat=None, click_lon=None):
+def _render_map(zones_gj, lat0=-3.689, lon0=-40.349):
+    # mapa base sem o marcador: o script Leaflet fica idêntico entre reruns,
+    # então o componente não é remontado a cada clique
     m = folium.Map(
         location=[lat0, lon0],
         zoom_start=12,
@@ -47,14 +77,39 @@ def _render_map(zones_gj, lat0=-3.689, lon0=-40.349, click_lat=None, click_lon=N
         tooltip=folium.GeoJsonTooltip(fields=["sigla"], aliases=["Zona"]),
     ).add_to(m)
 
+    folium.LayerControl(collapsed=True).add_to(m)
+    return m
+
+
+def _click_layer(click_lat=None, click_lon=None):
+    # enviado via feature_group_to_add: o front só troca esta camada
+    fg = folium.FeatureGroup(name="Ponto selecionado")
     if click_lat is not None and click_lon is not None:
         folium.Marker(
             location=[click_lat, click_lon],
             tooltip="Ponto selecionado",
-        ).add_to(m)
+        ).add_to(fg)
+    return fg
 
-    folium.LayerControl(collapsed=True).add_to(m)
-    return m
+
+def _on_map_change():
+    # roda antes do rerun: o clique já está no state quando o mapa é montado,
+    # sem precisar de um st.rerun() extra
+    clicked = (st.session_state.get(MAP_KEY) or {}).get("last_clicked")
+    if not clicked:
+        return
+
+    new_lat = float(clicked["lat"])
+    new_lon = float(clicked["lng"])
+
+    new_hash = f"{new_lat:.8f}_{new_lon:.8f}"
+
+    if new_hash != st.session_state.click_hash:
+        st.session_state.last_click = {
+            "lat": new_lat,
+            "lon": new_lon,
+        }
+        st.session_state.click_hash = new_hash
 
 
 # =============================
@@ -77,14 +132,6 @@ zones_gj = zones["geojson"]
 
 st.subheader("1) Selecione o ponto no mapa")
 
-radius_m = st.number_input(
-    "Raio para encontrar via (m)",
-    min_value=10,
-    max_value=100000,
-    value=100,
-    step=10,
-)
-
 if "last_click" not in st.session_state:
     st.session_state.last_click = None
 
@@ -93,29 +140,23 @@ if "click_hash" not in st.session_state:
 
 last_click = st.session_state.last_click
 
-m = _render_map(
-    zones_gj,
-    click_lat=last_click["lat"] if last_click else None,
-    click_lon=last_click["lon"] if last_click else None,
+# render=False: st_folium já renderiza o mapa e gera o script Leaflet; o
+# get_root().render() extra (HTML da página inteira) era descartado e custava
+# o mesmo que a serialização do GeoJSON das zonas.
+st_folium(
+    _render_map(zones_gj),
+    key=MAP_KEY,
+    width=None,
+    height=420,
+    render=False,
+    returned_objects=["last_clicked"],
+    feature_group_to_add=_click_layer(
+        click_lat=last_click["lat"] if last_click else None,
+        click_lon=last_click["lon"] if last_click else None,
+    ),
+    on_change=_on_map_change,
 )
 
-out = st_folium(m, width=None, height=420)
-
-if out and out.get("last_clicked"):
-
-    new_lat = float(out["last_clicked"]["lat"])
-    new_lon = float(out["last_clicked"]["lng"])
-
-    new_hash = f"{new_lat:.8f}_{new_lon:.8f}"
-
-    if new_hash != st.session_state.click_hash:
-        st.session_state.last_click = {
-            "lat": new_lat,
-            "lon": new_lon,
-        }
-        st.session_state.click_hash = new_hash
-        st.rerun()
-
 if st.session_state.last_click:
     st.caption(
         f"📍 Coordenadas selecionadas: "
@@ -123,20 +164,54 @@ if st.session_state.last_click:
         f"lon {st.session_state.last_click['lon']:.6f}"
     )
 
-calcular = st.button(
-    "🔎 Calcular viabilidade",
-    type="primary",
-    disabled=not st.session_state.last_click,
-)
+st.divider()
+
+
+# =============================
+# 2) Dados do lote (form: um único rerun no submit)
+# =============================
+
+st.subheader("2) Dados do lote")
+
+with st.form("lot_form"):
+
+    radius_m = st.number_input(
+        "Raio para encontrar via (m)",
+        min_value=10,
+        max_value=100000,
+        value=100,
+        step=10,
+    )
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        lot_area = st.number_input("Área do lote (m²)", min_value=1.0, value=300.0, step=10.0)
+
+    with col2:
+        testada = st.number_input("Largura (testada) (m)", min_value=1.0, value=10.0, step=0.5)
+
+    with col3:
+        profundidade = st.number_input("Profundidade (m)", min_value=1.0, value=30.0, step=0.5)
+
+    built_ground = st.number_input("Área pretendida no térreo (m²)", min_value=0.0, value=0.0, step=5.0)
+
+    use_type_code = st.text_input("use_type_code", value="RES_UNI")
+
+    calcular = st.form_submit_button(
+        "🔎 Calcular viabilidade",
+        type="primary",
+        disabled=not st.session_state.last_click,
+    )
 
 st.divider()
 
 
 # =============================
-# 2) Localização (zona + via)
+# 3) Localização (zona + via)
 # =============================
 
-st.subheader("2) Localização (zona + via)")
+st.subheader("3) Localização (zona + via)")
 
 zone = None
 street_info = None
@@ -186,29 +261,11 @@ st.divider()
 
 
 # =============================
-# 3) Dados do lote
+# 4) Regras (Supabase)
 # =============================
 
-st.subheader("3) Dados do lote")
-
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    lot_area = st.number_input("Área do lote (m²)", min_value=1.0, value=300.0, step=10.0)
-
-with col2:
-    testada = st.number_input("Largura (testada) (m)", min_value=1.0, value=10.0, step=0.5)
-
-with col3:
-    profundidade = st.number_input("Profundidade (m)", min_value=1.0, value=30.0, step=0.5)
-
-built_ground = st.number_input("Área pretendida no térreo (m²)", min_value=0.0, value=0.0, step=5.0)
-
 st.subheader("4) Regras (Supabase)")
 
-use_type_code = st.text_input("use_type_code", value="RES_UNI")
-
-
 if calcular and zone:
 
     try:
@@ -4,13 +4,12 @@ from typing import Any, Dict, Optional
 
 
 def _safe_float(v: Any) -> Optional[float]:
+    if v is None:
+        return None
     try:
-        if v is None:
-            return None
-        if isinstance(v, bool):
-            return float(int(v))
+        # bool cai aqui também: float(True) == 1.0; float("") levanta ValueError
         return float(v)
-    except Exception:
+    except (TypeError, ValueError, OverflowError):
         return None
 
 
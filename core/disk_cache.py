@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+# Cache em disco (pickle) para estruturas derivadas dos arquivos de data/.
+# - A entrada vale enquanto o arquivo-fonte não mudar (mtime + tamanho) e a versão bater.
+# - Qualquer falha (arquivo ausente, corrompido, sem permissão) vira "cache miss".
+
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+
+def cache_path(src: Path) -> Path:
+    # data/ruas.json -> data/ruas.cache.pkl
+    return src.with_suffix(".cache.pkl")
+
+
+def _source_key(src: Path, version: int) -> Tuple[int, int, int]:
+    st = src.stat()
+    return (int(version), int(st.st_mtime_ns), int(st.st_size))
+
+
+def load(src: Path, version: int) -> Optional[Any]:
+    try:
+        with cache_path(src).open("rb") as f:
+            entry = pickle.load(f)
+        if not isinstance(entry, dict) or entry.get("key") != _source_key(src, version):
+            return None
+        return entry.get("payload")
+    except Exception:
+        return None
+
+
+def save(src: Path, version: int, payload: Any) -> None:
+    dst = cache_path(src)
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.tmp")
+    try:
+        with tmp.open("wb") as f:
+            pickle.dump({"key": _source_key(src, version), "payload": payload}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # troca atômica: leitores concorrentes nunca veem um arquivo pela metade
+        os.replace(tmp, dst)
+    except Exception:
+        # falhou no meio (payload não serializável, disco cheio...): não deixa o .tmp para trás
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
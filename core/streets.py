@@ -5,16 +5,27 @@ from __future__ import annotations
 # - Adiciona diagnose(lat, lon, radius_m) para depuração (retorna SOMENTE dict JSON-serializável)
 
 import json
+import math
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from numbers import Integral
 
+import numpy as np
+import shapely
+import streamlit as st
 from pyproj import Transformer
+
+try:
+    import orjson
+except ImportError:  # opcional: sem orjson, cai no json da stdlib
+    orjson = None
 from shapely.geometry import Point, shape
-from shapely.ops import transform as shp_transform
 from shapely.strtree import STRtree
 
+from . import disk_cache
+
 REPO_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = REPO_ROOT / "data"
 RUAS_FILE = DATA_DIR / "ruas.json"
@@ -24,8 +35,66 @@ DST_EPSG = "EPSG:31984"  # UTM 24S (SIRGAS 2000) - metros
 
 _WGS84_TO_UTM24S = Transformer.from_crs(SRC_EPSG, DST_EPSG, always_xy=True).transform
 
+# sobe quando mudar o formato salvo em data/ruas.cache.pkl (ou a projeção/ingestão)
+_CACHE_VERSION = 4
+
+# metros por grau de latitude, arredondado para baixo (1° de latitude ≥ ~110,5 km;
+# folga também cobre o fator de escala do UTM, ≤ 0,04%). Em longitude o grau
+# encolhe para 111,32·cos(lat) km: _in_bbox divide a margem de longitude pelo
+# cos da latitude mais afastada do equador no bbox, então a margem fica sempre
+# um pouco maior que o raio, nunca menor, em qualquer latitude
+_M_PER_DEG_MIN = 110_000.0
+
+
+# campos de properties, em ordem de prioridade (o primeiro valor "verdadeiro" vence)
+_OFFICIAL_NAME_KEYS = ("log_ofic", "logradouro")
+_NAME_KEYS = _OFFICIAL_NAME_KEYS + ("rua", "nome", "name")
+_TYPE_KEYS = ("hierarquia", "type", "tipo")
+
+
+def _first_prop(props: Dict[str, Any], keys: Tuple[str, ...]) -> Any:
+    for k in keys:
+        v = props.get(k)
+        if v:
+            return v
+    return None
+
+
+def _geojson_bytes(geom_obj: Any) -> Any:
+    return orjson.dumps(geom_obj) if orjson is not None else json.dumps(geom_obj)
+
+
+def _project_utm(geoms: Any) -> List[Any]:
+    """Projeta todas as geometrias para UTM com uma única chamada ao PROJ.
+
+    Em vez de um callback Python por geometria (shapely.ops.transform), junta
+    os vértices num array Nx2, transforma de uma vez e devolve as coordenadas.
+    """
+    arr = np.asarray(geoms, dtype=object)
+    if arr.size == 0:
+        return []
+    # distâncias são 2D: descarta Z para get/set_coordinates trabalharem com Nx2
+    arr = shapely.force_2d(arr)
+    coords = shapely.get_coordinates(arr)
+    x, y = _WGS84_TO_UTM24S(coords[:, 0], coords[:, 1])
+    return list(shapely.set_coordinates(arr, np.column_stack([x, y])))
+
+
+def _latlon_arrays(lats: Any, lons: Any) -> Tuple[np.ndarray, np.ndarray]:
+    lats = np.asarray(lats, dtype=float).ravel()
+    lons = np.asarray(lons, dtype=float).ravel()
+    if lats.shape != lons.shape:
+        raise ValueError(f"lats e lons com tamanhos diferentes: {lats.size} e {lons.size}.")
+    return lats, lons
 
-@dataclass(frozen=True)
+
+def _point_utm(lat: float, lon: float) -> Point:
+    # um único par de coordenadas: chama o PROJ direto, sem shapely.ops.transform
+    x, y = _WGS84_TO_UTM24S(float(lon), float(lat))
+    return Point(x, y)
+
+
+@dataclass(frozen=True, slots=True)
 class StreetHit:
     name: str
     street_type: Optional[str]
@@ -37,29 +106,78 @@ class StreetsIndex:
         self.ruas_file = ruas_file
         self._tree_utm: Optional[STRtree] = None
         self._geoms_utm: List[Any] = []
-        self._meta_by_id: Dict[int, Dict[str, Any]] = {}
+        # nome/tipo já resolvidos, alinhados por índice com _geoms_utm (STRtree devolve índices)
+        self._names: List[str] = []
+        self._types: List[Optional[str]] = []
         self._built: bool = False
         self._features_count: int = 0
+        # (minlon, minlat, maxlon, maxlat) de todas as vias, calculado uma vez no build
+        self._bbox_wgs84: Optional[Tuple[float, float, float, float]] = None
 
     def build(self) -> "StreetsIndex":
         try:
-            features = self._load_features(self.ruas_file)
-            self._features_count = len(features)
-            self._ingest_to_utm(features)
+            if not self._load_cache():
+                features = self._load_features(self.ruas_file)
+                self._features_count = len(features)
+                self._ingest_to_utm(features)
+                self._save_cache()
             self._tree_utm = STRtree(self._geoms_utm) if self._geoms_utm else None
         except Exception:
             self._tree_utm = None
             self._geoms_utm = []
-            self._meta_by_id = {}
+            self._names = []
+            self._types = []
             self._features_count = 0
+            self._bbox_wgs84 = None
         self._built = True
         return self
 
+    def _load_cache(self) -> bool:
+        # geometrias já projetadas (WKB) + nome/tipo: pula parse do JSON e PROJ
+        cached = disk_cache.load(self.ruas_file, _CACHE_VERSION)
+        if not isinstance(cached, dict):
+            return False
+        # payload que não decodifica também é cache miss: cai no caminho do JSON
+        # (deixar a exceção subir para build() zeraria o índice do processo)
+        try:
+            geoms_utm = list(shapely.from_wkb(np.asarray(cached["wkb"], dtype=object)))
+            names = list(cached["names"])
+            types = list(cached["types"])
+            features_count = int(cached["features_count"])
+            bbox_wgs84 = cached["bbox_wgs84"]
+        except Exception:
+            return False
+        # listas desalinhadas dariam IndexError em nearest(): também é cache miss
+        if not (len(names) == len(types) == len(geoms_utm)):
+            return False
+        self._geoms_utm = geoms_utm
+        self._names = names
+        self._types = types
+        self._features_count = features_count
+        self._bbox_wgs84 = bbox_wgs84
+        return True
+
+    def _save_cache(self) -> None:
+        disk_cache.save(
+            self.ruas_file,
+            _CACHE_VERSION,
+            {
+                "wkb": list(shapely.to_wkb(np.asarray(self._geoms_utm, dtype=object))) if self._geoms_utm else [],
+                "names": self._names,
+                "types": self._types,
+                "features_count": self._features_count,
+                "bbox_wgs84": self._bbox_wgs84,
+            },
+        )
+
     @staticmethod
     def _load_features(path: Path) -> List[Dict[str, Any]]:
         if not path.exists():
             return []
-        data = json.loads(path.read_text(encoding="utf-8"))
+        if orjson is not None:
+            data = orjson.loads(path.read_bytes())  # decodifica direto dos bytes, em C
+        else:
+            data = json.loads(path.read_text(encoding="utf-8"))
         if isinstance(data, dict) and data.get("type") == "FeatureCollection":
             feats = data.get("features") or []
             return feats if isinstance(feats, list) else []
@@ -68,61 +186,81 @@ class StreetsIndex:
         return []
 
     def _ingest_to_utm(self, features: List[Dict[str, Any]]) -> None:
-        geoms_utm: List[Any] = []
-        meta: Dict[int, Dict[str, Any]] = {}
+        # passada única sobre as features, listas pré-alocadas; nada aqui levanta
+        # exceção para dados vindos de JSON (geometria ruim é filtrada pelo GEOS abaixo)
+        n_feats = len(features)
+        geom_objs: List[Any] = [None] * n_feats
+        geom_jsons: List[Any] = [None] * n_feats
+        names: List[str] = [""] * n_feats
+        types: List[Optional[str]] = [None] * n_feats
+        n = 0
 
         for feat in features:
-            try:
-                if not isinstance(feat, dict):
-                    continue
-                geom_obj = feat.get("geometry")
-                if not geom_obj:
-                    continue
-                geom_wgs = shape(geom_obj)
-                if geom_wgs.is_empty:
-                    continue
-                geom_utm = shp_transform(_WGS84_TO_UTM24S, geom_wgs)
-
-                props = feat.get("properties")
-                props = props if isinstance(props, dict) else {}
-
-                name = (
-                    props.get("log_ofic")
-                    or props.get("logradouro")
-                    or props.get("rua")
-                    or props.get("nome")
-                    or props.get("name")
-                    or ""
-                )
-
-                street_type = (
-                    props.get("hierarquia")
-                    or props.get("type")
-                    or props.get("tipo")
-                    or None
-                )
-
-                # Heurística: alguns exports colocam a classificação (ex.: "via_arterial_existente")
-                # no campo "name". Se isso acontecer e existir um logradouro oficial, usamos ele.
-                if isinstance(name, str) and isinstance(street_type, str):
-                    n = name.strip()
-                    t = street_type.strip()
-                    if n and t and (n == t or n.lower().startswith("via_")):
-                        alt = (props.get("log_ofic") or props.get("logradouro") or "").strip()
-                        if alt:
-                            name = alt
-
-
-                geoms_utm.append(geom_utm)
-                meta[id(geom_utm)] = {
-                    "name": str(name).strip(),
-                    "type": (str(street_type).strip() if street_type is not None else None),
-                }
-            except Exception:
+            if not isinstance(feat, dict):
+                continue
+            geom_obj = feat.get("geometry")
+            if not geom_obj:
                 continue
 
-        self._geoms_utm = geoms_utm
-        self._meta_by_id = meta
+            props = feat.get("properties")
+            props = props if isinstance(props, dict) else {}
+
+            name = _first_prop(props, _NAME_KEYS) or ""
+            street_type = _first_prop(props, _TYPE_KEYS)
+
+            # Heurística: alguns exports colocam a classificação (ex.: "via_arterial_existente")
+            # no campo "name". Se isso acontecer e existir um logradouro oficial, usamos ele.
+            if isinstance(name, str) and isinstance(street_type, str):
+                nm = name.strip()
+                t = street_type.strip()
+                if nm and t and (nm == t or nm.lower().startswith("via_")):
+                    alt = str(_first_prop(props, _OFFICIAL_NAME_KEYS) or "").strip()
+                    if alt:
+                        name = alt
+
+            geom_objs[n] = geom_obj
+            geom_jsons[n] = _geojson_bytes(geom_obj)
+            names[n] = str(name).strip()
+            types[n] = str(street_type).strip() if street_type is not None else None
+            n += 1
+
+        # construção vetorizada (leitor GeoJSON do GEOS, em C); geometria inválida vira None
+        geoms_wgs = shapely.from_geojson(np.asarray(geom_jsons[:n], dtype=object), on_invalid="ignore")
+        # o leitor do GEOS 3.11 recusa posições com altitude ([lon, lat, z], comum
+        # em exports de KML): o que ele devolveu como None tenta de novo via shape()
+        for i in np.flatnonzero(shapely.is_missing(geoms_wgs)).tolist():
+            try:
+                geoms_wgs[i] = shape(geom_objs[i])
+            except Exception:
+                pass
+        keep = np.flatnonzero(~(shapely.is_missing(geoms_wgs) | shapely.is_empty(geoms_wgs)))
+        geoms_wgs = geoms_wgs[keep]
+
+        # bbox do conjunto numa chamada só (antes da projeção, que é in-place)
+        self._bbox_wgs84 = (
+            tuple(float(v) for v in shapely.total_bounds(geoms_wgs)) if len(geoms_wgs) else None
+        )
+
+        # projeção em lote (in-place): as geometrias WGS84 viram UTM
+        self._geoms_utm = _project_utm(geoms_wgs)
+        self._names = [names[i] for i in keep]
+        self._types = [types[i] for i in keep]
+
+    def _in_bbox(self, lat: Any, lon: Any, radius_m: float) -> Any:
+        # pré-filtro O(1) em graus: clique longe da malha viária (outro
+        # município, mar) dispensa o PROJ e a consulta à árvore.
+        # Aceita escalares ou arrays (operadores & em vez de and/encadeado).
+        if self._bbox_wgs84 is None:
+            return True
+        minx, miny, maxx, maxy = self._bbox_wgs84
+        dr = radius_m / _M_PER_DEG_MIN
+        # via dentro do raio está no bbox: o menor cos entre as latitudes dele vale para todas
+        cos_lat = max(math.cos(math.radians(max(abs(miny), abs(maxy)))), 1e-6)
+        dr_lon = dr / cos_lat
+        return (
+            (lon >= minx - dr_lon) & (lon <= maxx + dr_lon)
+            & (lat >= miny - dr) & (lat <= maxy + dr)
+        )
 
     def nearest(self, lat: float, lon: float, radius_m: float) -> Optional[StreetHit]:
         try:
@@ -135,47 +273,65 @@ class StreetsIndex:
             if radius_m <= 0:
                 return None
 
-            pt_utm = shp_transform(_WGS84_TO_UTM24S, Point(float(lon), float(lat)))
+            if not self._in_bbox(float(lat), float(lon), radius_m):
+                return None
 
-            candidates = self._tree_utm.query(pt_utm.buffer(radius_m))
-            if candidates is None or len(candidates) == 0:
+            pt_utm = _point_utm(lat, lon)
+
+            # vizinho mais próximo resolvido no GEOS e já limitado ao raio
+            # (sem buffer do ponto nem varredura dos candidatos em Python)
+            idxs, dists = self._tree_utm.query_nearest(pt_utm, max_distance=radius_m, return_distance=True)
+            if len(idxs) == 0:
                 return None
 
-            best_geom = None
-            best_d = None
-
-            first = candidates[0]
-            if isinstance(first, Integral):
-                for idx in candidates:
-                    try:
-                        i = int(idx)
-                        if i < 0 or i >= len(self._geoms_utm):
-                            continue
-                        g = self._geoms_utm[i]
-                        d = float(pt_utm.distance(g))
-                        if best_d is None or d < best_d:
-                            best_d = d
-                            best_geom = g
-                    except Exception:
-                        continue
-            else:
-                for g in candidates:
-                    try:
-                        d = float(pt_utm.distance(g))
-                        if best_d is None or d < best_d:
-                            best_d = d
-                            best_geom = g
-                    except Exception:
-                        continue
-
-            if best_geom is None or best_d is None or best_d > radius_m:
+            # empate de distância: fica o menor índice (ordem do arquivo)
+            k = int(np.argmin(idxs))
+            best_i = int(idxs[k])
+            best_d = float(dists[k])
+
+            if best_d > radius_m:
                 return None
 
-            m = self._meta_by_id.get(id(best_geom), {})
-            return StreetHit(name=m.get("name", ""), street_type=m.get("type", None), distance_m=best_d)
+            return StreetHit(name=self._names[best_i], street_type=self._types[best_i], distance_m=best_d)
         except Exception:
             return None
 
+    def nearest_many(self, lats: Any, lons: Any, radius_m: float) -> List[Optional[StreetHit]]:
+        """Versão em lote de nearest(): um PROJ e uma consulta à árvore para N pontos."""
+        lats, lons = _latlon_arrays(lats, lons)
+        out: List[Optional[StreetHit]] = [None] * len(lats)
+        try:
+            if not self._built:
+                self.build()
+            if not self._tree_utm or not self._geoms_utm:
+                return out
+
+            radius_m = float(radius_m)
+            if radius_m <= 0 or len(lats) == 0:
+                return out
+
+            sel = np.flatnonzero(np.broadcast_to(self._in_bbox(lats, lons, radius_m), lats.shape))
+            if sel.size == 0:
+                return out
+
+            xs, ys = _WGS84_TO_UTM24S(lons[sel], lats[sel])
+            (src, idxs), dists = self._tree_utm.query_nearest(
+                shapely.points(xs, ys), max_distance=radius_m, return_distance=True
+            )
+
+            # empate de distância: fica o menor índice (ordem do arquivo), como em nearest()
+            order = np.lexsort((idxs, src))
+            src, idxs, dists = src[order], idxs[order], dists[order]
+            first = np.ones(len(src), dtype=bool)
+            first[1:] = src[1:] != src[:-1]
+
+            for s, i, d in zip(src[first].tolist(), idxs[first].tolist(), dists[first].tolist()):
+                if d <= radius_m:
+                    out[int(sel[s])] = StreetHit(name=self._names[i], street_type=self._types[i], distance_m=d)
+            return out
+        except Exception:
+            return [None] * len(lats)
+
     def diagnose(self, lat: float, lon: float, radius_m: float) -> Dict[str, Any]:
         out: Dict[str, Any] = {
             "ruas_file": str(self.ruas_file),
@@ -185,6 +341,7 @@ class StreetsIndex:
             "built": bool(self._built),
             "features_count": int(getattr(self, "_features_count", 0)),
             "geoms_count": int(len(self._geoms_utm)),
+            "bbox_wgs84": (list(self._bbox_wgs84) if self._bbox_wgs84 else None),
             "tree_built": bool(self._tree_utm is not None),
             "input": {"lat": float(lat), "lon": float(lon), "radius_m": float(radius_m)},
             "query": {},
@@ -196,6 +353,7 @@ class StreetsIndex:
                 out["built"] = True
                 out["features_count"] = int(getattr(self, "_features_count", 0))
                 out["geoms_count"] = int(len(self._geoms_utm))
+                out["bbox_wgs84"] = list(self._bbox_wgs84) if self._bbox_wgs84 else None
                 out["tree_built"] = bool(self._tree_utm is not None)
 
             if not self._tree_utm or not self._geoms_utm:
@@ -203,9 +361,10 @@ class StreetsIndex:
                 return out
 
             radius_m = float(radius_m)
-            pt_utm = shp_transform(_WGS84_TO_UTM24S, Point(float(lon), float(lat)))
-            buf = pt_utm.buffer(radius_m)
-            candidates = self._tree_utm.query(buf)
+            pt_utm = _point_utm(lat, lon)
+            # teste de distância nativo do GEOS: conta só vias realmente dentro do raio,
+            # sem montar o polígono do buffer
+            candidates = self._tree_utm.query(pt_utm, predicate="dwithin", distance=radius_m)
 
             candidates_count = int(0 if candidates is None else len(candidates))
             mode = None
@@ -214,44 +373,21 @@ class StreetsIndex:
 
             out["query"] = {"candidates_count": candidates_count, "candidates_mode": mode}
 
-            if candidates_count == 0:
+            # via mais próxima sem limite de raio: mostra a que distância ela está
+            # mesmo quando nada cai dentro do raio
+            idxs, dists = self._tree_utm.query_nearest(pt_utm, return_distance=True)
+            if len(idxs) == 0:
                 return out
 
-            best_geom = None
-            best_d = None
-
-            if mode == "indices":
-                for idx in candidates:
-                    try:
-                        i = int(idx)
-                        if i < 0 or i >= len(self._geoms_utm):
-                            continue
-                        g = self._geoms_utm[i]
-                        d = float(pt_utm.distance(g))
-                        if best_d is None or d < best_d:
-                            best_d = d
-                            best_geom = g
-                    except Exception:
-                        continue
-            else:
-                for g in candidates:
-                    try:
-                        d = float(pt_utm.distance(g))
-                        if best_d is None or d < best_d:
-                            best_d = d
-                            best_geom = g
-                    except Exception:
-                        continue
-
-            if best_geom is None or best_d is None:
-                return out
+            k = int(np.argmin(idxs))
+            best_i = int(idxs[k])
+            best_d = float(dists[k])
 
-            m = self._meta_by_id.get(id(best_geom), {})
             out["best"] = {
                 "distance_m": float(best_d),
                 "within_radius": bool(best_d <= radius_m),
-                "name": str(m.get("name", "")),
-                "type": (m.get("type", None) if m.get("type", None) is None else str(m.get("type", ""))),
+                "name": self._names[best_i],
+                "type": self._types[best_i],
             }
             return out
         except Exception as e:
@@ -259,26 +395,56 @@ class StreetsIndex:
             return out
 
 
-_INDEX: Optional[StreetsIndex] = None
+@st.cache_resource(show_spinner=False)
+def _get_index() -> StreetsIndex:
+    # singleton entre sessões/threads (mesmo padrão de get_supabase): o
+    # Streamlit serializa o cold start, então o índice é construído uma vez só
+    return StreetsIndex().build()
 
 
-def _get_index() -> StreetsIndex:
-    global _INDEX
-    if _INDEX is None:
-        _INDEX = StreetsIndex().build()
-    return _INDEX
+# chave do cache: coordenadas em micrograus (~11 cm) e raio em decímetros
+_COORD_Q = 1_000_000
+_RADIUS_Q = 10
+
+
+@lru_cache(maxsize=4096)
+def _find_street_cached(lat_q: int, lon_q: int, radius_q: int) -> Optional[Tuple[str, Optional[str], float]]:
+    hit = _get_index().nearest(lat=lat_q / _COORD_Q, lon=lon_q / _COORD_Q, radius_m=radius_q / _RADIUS_Q)
+    if hit is None:
+        return None
+    return (hit.name, hit.street_type, float(hit.distance_m))
 
 
 def find_street(lat: float, lon: float, radius_m: float = 150.0) -> Optional[Dict[str, Any]]:
+    # reruns do Streamlit repetem o mesmo clique/raio: resposta sai do LRU
     try:
-        hit = _get_index().nearest(lat=lat, lon=lon, radius_m=radius_m)
+        hit = _find_street_cached(
+            int(round(float(lat) * _COORD_Q)),
+            int(round(float(lon) * _COORD_Q)),
+            int(round(float(radius_m) * _RADIUS_Q)),
+        )
         if hit is None:
             return None
-        return {"name": hit.name, "type": hit.street_type, "distance_m": float(hit.distance_m)}
+        name, street_type, distance_m = hit
+        return {"name": name, "type": street_type, "distance_m": distance_m}
     except Exception:
         return None
 
 
+def find_streets_bulk(lats: Any, lons: Any, radius_m: float = 150.0) -> List[Optional[Dict[str, Any]]]:
+    # vários pontos de uma vez (ex.: lote de coordenadas); mesmo formato de find_street.
+    # Entrada malformada é erro do chamador: sobe ValueError em vez de virar "sem via".
+    lats, lons = _latlon_arrays(lats, lons)
+    try:
+        hits = _get_index().nearest_many(lats=lats, lons=lons, radius_m=radius_m)
+    except Exception:
+        return [None] * len(lats)
+    return [
+        None if h is None else {"name": h.name, "type": h.street_type, "distance_m": h.distance_m}
+        for h in hits
+    ]
+
+
 def diagnose(lat: float, lon: float, radius_m: float = 150.0) -> Dict[str, Any]:
     try:
         return _get_index().diagnose(lat=lat, lon=lon, radius_m=radius_m)
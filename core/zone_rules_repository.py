@@ -1,10 +1,31 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import streamlit as st
 
 from .supabase_client import get_supabase
 
 
+# colunas lidas de zone_rules: chave + campos usados pelo app (ver README);
+# incluir aqui se algum chamador precisar de outro campo
+_COLUMNS = (
+    "zone_sigla",
+    "use_type_code",
+    "subzone_code",
+    "to_max_pct",
+    "tp_min_pct",
+    "ia_max",
+    "recuo_frontal_m",
+    "recuo_lateral_m",
+    "recuo_fundos_m",
+)
+
+# validade da tabela em memória: regra incluída/alterada no Supabase aparece
+# sozinha depois disso (vale também para pares ainda sem regra)
+_TABLE_TTL_S = 300
+
+
 class ZoneRule(dict):
     """Dict-like rule object (JSON-serializable) with attribute access.
 
@@ -12,8 +33,11 @@ class ZoneRule(dict):
     - Streamlit `st.json()` expects a real JSON object (dict/list). A dataclass may break the UI.
     - Older code may call `rule.get(...)` (dict-style) or `rule.to_max_pct` (attribute-style).
     This class supports both.
+    Stays a dict subclass (see above); `__slots__ = ()` only drops the unused per-instance __dict__.
     """
 
+    __slots__ = ()
+
     def __init__(self, **kwargs: Any):
         super().__init__(**kwargs)
 
@@ -37,40 +61,71 @@ def get_zone_rule(zone_sigla: str, use_type_code: str, subzone_code: str = "PADR
     IMPORTANT:
     - Seu schema atual tem UNIQUE (zone_sigla, use_type_code, subzone_code) e subzone_code NOT NULL.
     - Para regra geral, usamos subzone_code='PADRAO'.
+    - A tabela inteira é lida uma vez por processo (_zone_rules_table); aqui é só
+      lookup em memória. Cada chamada recebe uma cópia, então o chamador pode
+      mexer no ZoneRule sem sujar o cache.
     """
-    sb = get_supabase()
-    if sb is None:
+    return _resolve(_zone_rules_table(), zone_sigla, use_type_code, subzone_code)
+
+
+def get_zone_rules_bulk(
+    pairs: Iterable[Tuple[str, str]], subzone_code: str = "PADRAO"
+) -> Dict[Tuple[str, str], ZoneRule]:
+    """Várias regras de uma vez: {(zona, uso): ZoneRule}.
+
+    Mesma resolução de get_zone_rule (subzona pedida, depois qualquer subzona),
+    tudo sobre uma única leitura da tabela: nenhum round-trip por par, e o TTL
+    vencendo no meio do lote não mistura duas versões. Pares sem regra ficam
+    fora do dict.
+    """
+    table = _zone_rules_table()
+    out: Dict[Tuple[str, str], ZoneRule] = {}
+    for zone_sigla, use_type_code in pairs:
+        key = (zone_sigla, use_type_code)
+        if key in out:
+            continue
+        rule = _resolve(table, zone_sigla, use_type_code, subzone_code)
+        if rule is not None:
+            out[key] = rule
+    return out
+
+
+def _resolve(
+    table: Dict[str, Dict[Tuple[str, ...], Dict[str, Any]]],
+    zone_sigla: str,
+    use_type_code: str,
+    subzone_code: str,
+) -> Optional[ZoneRule]:
+    row = table["by_subzone"].get((zone_sigla, use_type_code, subzone_code))
+    if row is None:
+        # fallback: tenta achar qualquer subzona se não existir PADRAO
+        row = table["by_use"].get((zone_sigla, use_type_code))
+    if row is None:
         return None
+    return ZoneRule(**row)
+
 
-    resp = (
-        sb.table("zone_rules")
-        .select("*")
-        .eq("zone_sigla", zone_sigla)
-        .eq("use_type_code", use_type_code)
-        .eq("subzone_code", subzone_code)
-        .limit(1)
-        .execute()
-    )
+def clear_zone_rules_cache() -> None:
+    """Descarta a tabela em memória (ex.: depois de editar zone_rules no Supabase)."""
+    _zone_rules_table.clear()
 
+
+@st.cache_resource(show_spinner=False, ttl=_TABLE_TTL_S)
+def _zone_rules_table() -> Dict[str, Dict[Tuple[str, ...], Dict[str, Any]]]:
+    # tabela pequena (dezenas de linhas): um único round-trip substitui
+    # um select por (zona, uso) a cada cálculo
+    sb = get_supabase()
+    resp = sb.table("zone_rules").select(",".join(_COLUMNS)).execute()
     data = getattr(resp, "data", None) or []
-    if not data:
-        # fallback: tenta achar qualquer subzona se não existir PADRAO
-        resp2 = (
-            sb.table("zone_rules")
-            .select("*")
-            .eq("zone_sigla", zone_sigla)
-            .eq("use_type_code", use_type_code)
-            .limit(1)
-            .execute()
-        )
-        data2 = getattr(resp2, "data", None) or []
-        if not data2:
-            return None
-        row = data2[0]
-    else:
-        row = data[0]
-
-    if not isinstance(row, dict):
-        row = dict(row)
 
-    return ZoneRule(**row)
+    by_subzone: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    by_use: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for row in data:
+        if not isinstance(row, dict):
+            row = dict(row)
+        zone = row.get("zone_sigla")
+        use = row.get("use_type_code")
+        by_subzone.setdefault((zone, use, row.get("subzone_code")), row)
+        by_use.setdefault((zone, use), row)
+
+    return {"by_subzone": by_subzone, "by_use": by_use}
@@ -1,28 +1,95 @@
 from __future__ import annotations
 
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
-from shapely.geometry import Point, shape
-from shapely.prepared import prep
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+try:
+    import orjson
+except ImportError:  # opcional: sem orjson, cai no json da stdlib
+    orjson = None
+
+from . import disk_cache
 
 
 @dataclass(frozen=True)
 class ZoneFeature:
     sigla: str
-    geom_prep: Any  # PreparedGeometry
+    # geometria shapely da zona (o mesmo objeto de ZoneIndex.geoms). Apesar do nome,
+    # só é preparada acima de _PREPARE_MIN_COORDS vértices; as consultas usam
+    # ZoneIndex.geoms, este campo fica para quem lê as features diretamente.
+    geom_prep: Any
+
+
+@dataclass(frozen=True)
+class ZoneIndex:
+    features: List[ZoneFeature]
+    geoms: Any  # np.ndarray de geometrias, alinhado com `features`
+    tree: Any  # STRtree sobre `geoms` (mesmos índices), usado nas consultas em lote
+    bounds: Any  # np.ndarray (4, N): minx, miny, maxx, maxy de cada zona
+    # memo de zone_from_latlon: {(lon, lat): sigla}; fora de eq/hash/repr
+    lookups: Dict[Tuple[float, float], Optional[str]] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+
+
+# sobe quando mudar o formato salvo em data/zoneamento_light.cache.pkl
+_CACHE_VERSION = 1
+
+# limite de entradas do memo de zone_from_latlon (ao estourar, recomeça vazio)
+_LOOKUP_CACHE_MAX = 4096
+
+# abaixo disto (vértices) a zona não é preparada; contains funciona igual nas duas
+_PREPARE_MIN_COORDS = 32
+
+
+def read_geojson(path: Path) -> Any:
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())  # decodifica direto dos bytes, em C
+    return json.loads(path.read_text(encoding="utf-8"))
+
 
+def load_zones(zone_file: Path, obj: Any = None) -> ZoneIndex:
+    """Zonas do arquivo, com cache em disco (WKB) enquanto o arquivo não mudar.
 
-def load_zones(zone_file: Path) -> List[ZoneFeature]:
-    obj = json.loads(zone_file.read_text(encoding="utf-8"))
+    `obj`: GeoJSON já parseado pelo chamador, usado só em cache miss (evita reler o arquivo).
+    """
+    cached = disk_cache.load(zone_file, _CACHE_VERSION)
+    if isinstance(cached, dict):
+        # payload que não decodifica (ou desalinhado) também é cache miss
+        try:
+            siglas = list(cached["siglas"])
+            geoms = shapely.from_wkb(np.asarray(cached["wkb"], dtype=object))
+            if siglas and len(siglas) == len(geoms):
+                return _build_index(siglas, geoms)
+        except Exception:
+            pass
 
+    if obj is None:
+        obj = read_geojson(zone_file)
+    zones = zones_from_geojson(obj)
+    disk_cache.save(
+        zone_file,
+        _CACHE_VERSION,
+        {"siglas": [z.sigla for z in zones.features], "wkb": list(shapely.to_wkb(zones.geoms))},
+    )
+    return zones
+
+
+def zones_from_geojson(obj: Any) -> ZoneIndex:
+    """Monta as zonas a partir do GeoJSON já carregado (evita reler/parsear o arquivo)."""
     feats = obj.get("features") if isinstance(obj, dict) else None
     if not feats:
         raise RuntimeError("zoneamento_light.json inválido: não achei 'features'.")
 
-    out: List[ZoneFeature] = []
+    siglas: List[str] = []
+    geoms_list: List[Any] = []
     for f in feats:
         props = f.get("properties") or {}
         sigla = props.get("sigla") or props.get("SIGLA") or props.get("zona")
@@ -31,17 +98,78 @@ def load_zones(zone_file: Path) -> List[ZoneFeature]:
         geom = f.get("geometry")
         if not geom:
             continue
-        out.append(ZoneFeature(sigla=str(sigla).strip(), geom_prep=prep(shape(geom))))
+        siglas.append(str(sigla).strip())
+        geoms_list.append(shape(geom))
 
-    if not out:
+    if not siglas:
         raise RuntimeError("Nenhuma zona encontrada no GeoJSON.")
 
-    return out
+    return _build_index(siglas, np.array(geoms_list, dtype=object))
+
+
+def _build_index(siglas: List[str], geoms: Any) -> ZoneIndex:
+    # prepara as geometrias numa chamada só (GEOS, sem loop Python), exceto as
+    # pequenas: para poucos vértices o índice preparado custa mais do que poupa.
+    # Geometria preparada não vai para o pickle, então isto roda também no cache hit.
+    shapely.prepare(geoms[shapely.get_num_coordinates(geoms) > _PREPARE_MIN_COORDS])
+    features = [ZoneFeature(sigla=s, geom_prep=g) for s, g in zip(siglas, geoms)]
+    return ZoneIndex(
+        features=features,
+        geoms=geoms,
+        tree=STRtree(geoms),
+        bounds=np.ascontiguousarray(shapely.bounds(geoms).T),
+    )
+
 
+def zone_from_latlon(zones: ZoneIndex, lat: float, lon: float) -> Optional[str]:
+    # reruns do Streamlit repetem o mesmo clique (mesmos floats): resposta sai do memo
+    key = (float(lon), float(lat))
+    try:
+        return zones.lookups[key]
+    except KeyError:
+        pass
+    sigla = _zone_at(zones, *key)
+    if len(zones.lookups) >= _LOOKUP_CACHE_MAX:
+        zones.lookups.clear()
+    zones.lookups[key] = sigla
+    return sigla
 
-def zone_from_latlon(zones: List[ZoneFeature], lat: float, lon: float) -> Optional[str]:
-    p = Point(float(lon), float(lat))
-    for z in zones:
-        if z.geom_prep.contains(p):
-            return z.sigla
-    return None
+
+def _zone_at(zones: ZoneIndex, x: float, y: float) -> Optional[str]:
+    # ponto único: teste de bbox em numpy sobre as N zonas e contains_xy nos
+    # candidatos, sem criar Point nem consultar a árvore. flatnonzero já sai em
+    # ordem crescente: a primeira zona na ordem do arquivo continua vencendo.
+    minx, miny, maxx, maxy = zones.bounds
+    cand = np.flatnonzero((minx <= x) & (x <= maxx) & (miny <= y) & (y <= maxy))
+    if cand.size == 0:
+        return None
+    hits = cand[shapely.contains_xy(zones.geoms[cand], x, y)]
+    if hits.size == 0:
+        return None
+    return zones.features[int(hits[0])].sigla
+
+
+def zones_from_latlon_batch(zones: ZoneIndex, lats: Any, lons: Any) -> np.ndarray:
+    """Versão em lote de zone_from_latlon: array (object) de siglas, None fora das zonas."""
+    xs = np.asarray(lons, dtype=np.float64).ravel()
+    ys = np.asarray(lats, dtype=np.float64).ravel()
+    if xs.shape != ys.shape:
+        raise ValueError(f"lats e lons com tamanhos diferentes: {ys.size} e {xs.size}.")
+    out = np.full(xs.shape, None, dtype=object)
+    if xs.size == 0:
+        return out
+
+    # pares (ponto, zona) cujas bboxes se tocam, numa consulta só à árvore
+    src, zi = zones.tree.query(shapely.points(xs, ys))
+    inside = shapely.contains_xy(zones.geoms[zi], xs[src], ys[src])
+    src, zi = src[inside], zi[inside]
+    if src.size == 0:
+        return out
+
+    # zona sobreposta: a primeira na ordem do arquivo vence, como em zone_from_latlon
+    order = np.lexsort((zi, src))
+    src, zi = src[order], zi[order]
+    first = np.ones(src.size, dtype=bool)
+    first[1:] = src[1:] != src[:-1]
+    out[src[first]] = [zones.features[i].sigla for i in zi[first].tolist()]
+    return out